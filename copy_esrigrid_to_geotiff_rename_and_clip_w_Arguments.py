@@ -13,6 +13,11 @@ as long as boto3 is installed.
 REQUIREMENTS:
 
 arcpy (tested with ArcGIS Pro V3.3)
+pyproj (included with ArcGIS Pro, or: `pip install pyproj`)
+GDAL Python bindings (osgeo) are optional: if installed along with the NZGD49 grid of PROJ-data (nz_linz_nzgd2kgrid0005.tif),
+each region is reprojected and clipped in one warp straight from the ASCII grid, otherwise the grids are copied to GeoTIFF
+and clipped with arcpy. The log says which one is used. Note the outputs differ slightly: the warp resamples bilinearly,
+the arcpy clip takes the nearest cell.
 boto3 must be installed via ArcGIS Pro package manager (or: `pip install boto3`)
 and a valid AWS credentials profile must be configured on the machine running this script.
 --> if boto3 cannot be installed, the script skips over the upload part and will simply leave the zipped output in the output folder.
@@ -23,6 +28,11 @@ USAGE:
 This script can be run from the command line with or without arguments, or from within ArcGIS Pro.
 The easiest way to run it is as a standalone script, with no parameters (it will use the defaults configured below)
 
+Every input grid/region pair is queued as a task in a SQLite database next to the log (cache.db, see task_queue.py).
+If a run is interrupted, run the script again and it picks up the remaining tasks instead of starting from scratch -
+tasks that failed and grids that changed since are done again as well. After a complete run the next one starts over,
+skipping the clips that are uploaded already and unchanged.
+
 ArcGIS Pro usage:
 
 1. Configure the script arguments (see below) to be used as default parameters in the tool 
@@ -46,15 +56,42 @@ Tilmann Steinmetz, 24 June 2024
 
 # Standard imports
 import argparse
+import atexit
+import collections
+import concurrent.futures
 from datetime import datetime as datetimedatetime
+import functools
+import glob
+import io
 import json
+import math
+import multiprocessing
 import os
 import logging
+import pickle
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import types
 import zipfile
 
 # arcpy import
 import arcpy
 
+# pyproj import
+import pyproj
+
+# Queue of the (input grid, region) tasks of a run, next to this script
+from task_queue import (
+    claim_task,
+    count_failed_tasks,
+    enqueue_tasks,
+    fail_task,
+    finish_task,
+)
+
 # Create logging
 L = os.path.join(r"D:\Temp\logs", "Climatology-grids.log")
 logging.basicConfig(
@@ -65,6 +102,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Cache of the clips uploaded in earlier runs (see open_upload_cache) and queue of the tasks of a run (see enqueue_tasks),
+# next to the log
+CACHE_DB = os.path.join(os.path.dirname(L), "cache.db")
+
+# A failed upload is started again after RETRY_DELAY * 2**attempts seconds, up to MAX_UPLOAD_ATTEMPTS attempts
+RETRY_DELAY = 5
+MAX_UPLOAD_ATTEMPTS = 4
+
 logger.info("Starting")
 
 # S3 bucket name
@@ -78,18 +123,48 @@ try:
     # try to import boto3 and create a session
     # deal with S3/AWS connection - but don't fail if the import isn't working
     import boto3
+    from boto3.s3.transfer import TransferConfig
     from botocore.exceptions import ClientError
+    from s3transfer.manager import TransferManager
 
     # make connection to S3 bucket Replace # 'your_aws_profile' with the name of your AWS profile if you have one configured.
     #  If not, you can remove the # profile_name parameter, and Boto3 will use your default AWS credentials.
     session = boto3.Session()
-    s3 = session.resource("s3")
     # session = boto3.Session(profile_name='your_aws_profile')
 
+    # One client for all uploads - clients are thread-safe, so the TLS connections are reused
+    s3_client = session.client("s3")
+
+    # Upload files above 8 MB in 8 MB parts, sent over up to 16 threads
+    TRANSFER_CFG = TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        max_concurrency=16,
+        multipart_chunksize=8 * 1024 * 1024,
+        use_threads=True,
+    )
+
+    # One transfer manager for the whole run, so all uploads share its threads and HTTP connections
+    MANAGER = TransferManager(s3_client, config=TRANSFER_CFG)
+    atexit.register(MANAGER.shutdown)
+
 except ImportError:
     arcpy.AddWarning("Can't import boto3 - Files won't be uploaded to S3 Bucket.")
     logger.warning("Can't import boto3 - Files won't be uploaded to S3 Bucket.")
-    pass
+    MANAGER = None
+
+try:
+    # GDAL reprojects and clips in a single warp, straight from the ASCII grids
+    # - without it, the grids are copied to GeoTIFF and clipped with arcpy
+    from osgeo import gdal, ogr, osr
+
+    gdal.UseExceptions()
+    osr.UseExceptions()
+except ImportError:
+    gdal = None
+    logger.info("Can't import GDAL - Rasters will be copied and clipped with arcpy.")
+
+# The metadata JSON files are written to disk on their own thread (see create_json_file)
+JSON_WRITER = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
 DEFAULT_FILENAME = rf"C:\temp\copy_esrigrid_to_geotiff_rename_and_clip_w_Arguments.py"
 
@@ -105,6 +180,22 @@ OUTPUT_FOLDER_ZIPPED = r"D:\Temp\climate_raster_grids_export\regions_grids\zippe
 # Set the projection for the output GeoTIFFs
 output_projection = arcpy.SpatialReference("GD_1949_New_Zealand_Map_Grid")
 
+# Transformation from the input projection (NZMG, EPSG:27200) to NZTM (EPSG:2193) for the GDAL warp: the NTv2 grid
+# of New_Zealand_1949_To_NZGD_2000_3_NTv2 (EPSG:1568), which the arcpy clip uses. If the grid (PROJ-data
+# nz_linz_nzgd2kgrid0005.tif) is not installed, the regions are clipped with arcpy instead (see _gdal_warp_available)
+NZMG_TO_NZTM_PIPELINE = (
+    "+proj=pipeline "
+    "+step +inv +proj=nzmg +lat_0=-41 +lon_0=173 +x_0=2510000 +y_0=6023150 +ellps=intl "
+    "+step +proj=hgridshift +grids=nz_linz_nzgd2kgrid0005.tif "
+    "+step +proj=tmerc +lat_0=0 +lon_0=173 +k=0.9996 +x_0=1600000 +y_0=10000000 +ellps=GRS80"
+)
+
+# Set the projection the region geometries are read in (NZTM), so they can be handed to the clip workers as WKT
+region_projection = arcpy.SpatialReference(2193)
+
+# Reproject the region extents from NZTM to WGS 84 (standard for GeoJSON) for the metadata
+TRANSFORMER_2193_TO_4326 = pyproj.Transformer.from_crs(2193, 4326, always_xy=True)
+
 
 # Define earliest valid date (iso_date_str_start)
 START_DATE_STR = "1991-01-01"
@@ -116,96 +207,119 @@ STOP_DATE_STR = "2020-12-31"
 date_obj_stop = datetimedatetime.strptime(STOP_DATE_STR, "%Y-%m-%d")
 iso_date_str_stop = date_obj_stop.isoformat()
 
+# Input file names are <name>_<parameter code>_<...>_<...>_<statistic>_<period>, e.g. "..._00_..._..._mean_monthly1"
+_NAME_RE = re.compile(
+    r"^[^_]+_(?P<param>\d{2})_[^_]+_[^_]+_(?P<stat>[^_]+)_(?P<period>[a-z]+\d*)$"
+)
+
 # Define the dictionary for month-name lookup
-lookup_month_and_season_name = {
-    "monthly1": "January",
-    "monthly2": "February",
-    "monthly3": "March",
-    "monthly4": "April",
-    "monthly5": "May",
-    "monthly6": "June",
-    "monthly7": "July",
-    "monthly8": "August",
-    "monthly9": "September",
-    "monthly10": "October",
-    "monthly11": "November",
-    "monthly12": "December",
-    "seasonal1": "Summer",
-    "seasonal2": "Autumn",
-    "seasonal3": "Winter",
-    "seasonal4": "Spring",
-    "annual": "Annual",
-}
+lookup_month_and_season_name = types.MappingProxyType(
+    {
+        "monthly1": "January",
+        "monthly2": "February",
+        "monthly3": "March",
+        "monthly4": "April",
+        "monthly5": "May",
+        "monthly6": "June",
+        "monthly7": "July",
+        "monthly8": "August",
+        "monthly9": "September",
+        "monthly10": "October",
+        "monthly11": "November",
+        "monthly12": "December",
+        "seasonal1": "Summer",
+        "seasonal2": "Autumn",
+        "seasonal3": "Winter",
+        "seasonal4": "Spring",
+        "annual": "Annual",
+    }
+)
 
 # Define the dictionary for parameter lookup (for the renaming of files)
-lookup_dict_parameter = {
-    "00": "Total-Rainfall",
-    "01": "Wet-Days-GT-1mm",
-    "02": "Mean-Air-Temperature",
-    "03": "Mean-Daily-Maximum-Air-Temperature",
-    "04": "Mean-Daily-Minimum-Air-Temperature",
-    "09": "Total-Sunshine",
-    "11": "Mean-Earth-Temperature-At-10cm",
-    "17": "Mean-Daily-Global-Irradiance",
-    "23": "Screen-Frost-Days",
-    "33": "Mean-Daily-Wind-Speed-At-10m",
-    "34": "Total-Penman-PET",
-    "37": "Total-Growing-Degree-Days-GDD-base-5degC",
-    "38": "Total-Growing-Degree-Days-GDD-base-10degC",
-    "64": "Mean-9AM-RH",
-    "68": "Total-Heating-Degree-Days-HDD-base-18degC",
-    "74": "Days-Of-Soil-Moisture-Deficit",
-    # Add more key-value pairs as needed
-}
+lookup_dict_parameter = types.MappingProxyType(
+    {
+        "00": "Total-Rainfall",
+        "01": "Wet-Days-GT-1mm",
+        "02": "Mean-Air-Temperature",
+        "03": "Mean-Daily-Maximum-Air-Temperature",
+        "04": "Mean-Daily-Minimum-Air-Temperature",
+        "09": "Total-Sunshine",
+        "11": "Mean-Earth-Temperature-At-10cm",
+        "17": "Mean-Daily-Global-Irradiance",
+        "23": "Screen-Frost-Days",
+        "33": "Mean-Daily-Wind-Speed-At-10m",
+        "34": "Total-Penman-PET",
+        "37": "Total-Growing-Degree-Days-GDD-base-5degC",
+        "38": "Total-Growing-Degree-Days-GDD-base-10degC",
+        "64": "Mean-9AM-RH",
+        "68": "Total-Heating-Degree-Days-HDD-base-18degC",
+        "74": "Days-Of-Soil-Moisture-Deficit",
+        # Add more key-value pairs as needed
+    }
+)
 
 # Define the dictionary for region lookup (for the renaming of files)
-lookup_dict_region = {
-    "01": "Northland",
-    "02": "Auckland",
-    "03": "Waikato",
-    "04": "Bay-Of-Plenty",
-    "05": "Gisborne",
-    "06": "Hawkes-Bay",
-    "07": "Taranaki",
-    "08": "Manawatu-Whanganui",
-    "09": "Wellington",
-    "12": "West-Coast",
-    "13": "Canterbury",
-    "14": "Otago",
-    "15": "Southland",
-    "16": "Tasman",
-    "17": "Nelson",
-    "18": "Marlborough",
-    "99": "Chatham-Islands",
-    # Add more key-value pairs as needed
-}
+lookup_dict_region = types.MappingProxyType(
+    {
+        "01": "Northland",
+        "02": "Auckland",
+        "03": "Waikato",
+        "04": "Bay-Of-Plenty",
+        "05": "Gisborne",
+        "06": "Hawkes-Bay",
+        "07": "Taranaki",
+        "08": "Manawatu-Whanganui",
+        "09": "Wellington",
+        "12": "West-Coast",
+        "13": "Canterbury",
+        "14": "Otago",
+        "15": "Southland",
+        "16": "Tasman",
+        "17": "Nelson",
+        "18": "Marlborough",
+        "99": "Chatham-Islands",
+        # Add more key-value pairs as needed
+    }
+)
 
 # Set the URL for the ArcGIS Online feature service
 FEATURE_SERVICE_URL = "https://services.arcgis.com/XTtANUDT8Va4DLwI/arcgis/rest/services/nz_regional_councils/FeatureServer/0"
 
-# Make a feature layer from the ArcGIS Online feature service
-feature_layer = arcpy.MakeFeatureLayer_management(FEATURE_SERVICE_URL, "feature_layer")
+# Cache file for the regions read from the feature service (see load_regions)
+REGIONS_CACHE = os.path.join(tempfile.gettempdir(), "regions.pkl")
 
 # Create a dictionary to store files with the same base name
-ascfile_dict = {}
+ascfile_dict = collections.defaultdict(list)
 tif_dict = {}
 
 
+def _scan_asc_files(path: str):
+    """Yield the DirEntry of every ASCII Grid file in path and its subfolders.
+    os.scandir returns the file type with the listing, so no extra stat call per file is needed on the network share
+    """
+    try:
+        entries = os.scandir(path)
+    except OSError as e:
+        # like os.walk, skip folders that can't be listed instead of failing the whole run
+        arcpy.AddWarning(f"Skipping folder {path}: {e}")
+        logger.warning(f"Skipping folder {path}: {e}")
+        return
+    with entries:
+        for entry in entries:
+            # don't follow symlinked folders (as os.walk), a link cycle would recurse forever
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_asc_files(entry.path)
+            elif entry.name.endswith(".asc"):
+                yield entry
+
+
 # Iterate over all ASCII Grid files in the input folder and subfolders
 def parse_input_files(input_location: str) -> dict:
     """Parse the input ASCII Grid files from input_location and create output folders. Create a dict with paths"""
     # Iterate over all ASCII Grid files in the input folder and subfolders
-    for root, dirs, files in os.walk(input_location):
-        for file in files:
-            if file.endswith(".asc"):
-                # Get the base name and extension
-                base_name, ext = os.path.splitext(file)
-
-                # Add the file to the dictionary
-                if base_name in ascfile_dict:
-                    ascfile_dict[base_name].append(os.path.join(root, file))
-                else:
-                    ascfile_dict[base_name] = [os.path.join(root, file)]
+    for entry in _scan_asc_files(input_location):
+        # Add the file to the dictionary under its base name
+        ascfile_dict[entry.name[: -len(".asc")]].append(entry.path)
 
     # Create the output folders
     os.makedirs(OUTPUT_FOLDER_CONVERTED, exist_ok=True)
@@ -225,153 +339,602 @@ def parse_input_files(input_location: str) -> dict:
 def process_files_in_ascdict(
     ascfile_dict: dict, COMPANY_bucket_data_hub: str, prefix: str
 ):
-    # Process each group of files with the same base name
-    for base_name, file_list in ascfile_dict.items():
-        logger.info(f"Processing files with base name: {base_name}")
-        """ Process the input ASCII grid files """
-        for file_path in file_list:
-            # Get the region code from the subfolder name
-            region_code = os.path.basename(os.path.dirname(file_path))
-
-            # Construct the input and output paths
-            input_raster = file_path
-            output_folder_converted_region = os.path.join(
-                OUTPUT_FOLDER_REGIONS, region_code
+    # All regions to clip, read once for the whole run
+    regions = load_regions(FEATURE_SERVICE_URL)
+    regions_by_code = {
+        region_row_tuple[0]: region_row_tuple for region_row_tuple in regions
+    }
+    # Project the region extents for the metadata once up front, create_json_file only looks them up
+    for region_row_tuple in regions:
+        _region_geojson_coords(region_row_tuple[0], region_row_tuple[3])
+
+    # Clips that were uploaded in an earlier run and haven't changed since are skipped
+    upload_cache = open_upload_cache()
+
+    # Every (input grid, region) pair is a task in a persistent queue, so an interrupted run picks up where it stopped
+    _warn_duplicate_outputs(ascfile_dict)
+    enqueue_tasks(upload_cache, ascfile_dict, regions)
+
+    # Raster to clip from, per input grid
+    source_rasters = {}
+    # Running clips: future -> (task, cache key, month/season name, zip file path)
+    clip_futures = {}
+    # Claimed tasks held back until their zip file is no longer in use: (task, zip file path)
+    held_tasks = []
+    # Uploads run on the transfer manager's threads, so S3 latency doesn't hold up the clipping.
+    # Holds (task, cache key, zip object name, [(file_path, start_upload, future), ...], attempts, retry_at) per region
+    region_uploads = []
+
+    # Clip with the GDAL warp only if it can do the same grid transformation as the arcpy clip
+    global _use_gdal_warp
+    _use_gdal_warp = _gdal_warp_available()
+    if _use_gdal_warp:
+        logger.info("Clipping the regions with the GDAL warp (bilinear resampling)")
+        arcpy.AddMessage(
+            "Clipping the regions with the GDAL warp (bilinear resampling)"
+        )
+    else:
+        logger.info("Clipping the regions with arcpy (nearest cell resampling)")
+        arcpy.AddMessage("Clipping the regions with arcpy (nearest cell resampling)")
+
+    # Inside ArcGIS Pro sys.executable is ArcGISPro.exe, so the worker processes have to be started with the python.exe of the environment
+    # - a python.exe (e.g. <venv>\Scripts\python.exe) is left as it is, it can start the workers itself
+    executable_name = os.path.basename(sys.executable).lower()
+    if sys.platform == "win32" and executable_name not in ("python.exe", "pythonw.exe"):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+
+    # Every region clip writes to its own output path, so the clips can run side by side on all but one of the cores
+    max_workers = max(1, (os.cpu_count() or 2) - 1)
+    # The pool already fills the cores, so each worker only gets its share of threads for GDAL
+    threads_per_worker = max(1, (os.cpu_count() or 2) // max_workers)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_clip_worker,
+        initargs=(
+            threads_per_worker,
+            _use_gdal_warp,
+            _worker_cache_max(max_workers),
+        ),
+    ) as executor:
+        while True:
+            # Keep the workers busy with the next pending tasks
+            while len(clip_futures) < max_workers:
+                # A held back task goes first once its zip is free, otherwise the next pending task is claimed
+                zips_in_use = _zips_in_use(clip_futures, region_uploads)
+                held_task = next(
+                    (held for held in held_tasks if held[1] not in zips_in_use), None
+                )
+                if held_task is not None:
+                    held_tasks.remove(held_task)
+                    task = held_task[0]
+                else:
+                    task = claim_task(upload_cache)
+                    if task is None:
+                        break
+                base_name, input_raster, region_code = task
+                try:
+                    new_file_name, month_and_season = _build_new_name(base_name)
+
+                    # Skip the regions that are in the bucket from an earlier run already
+                    cache_key = _upload_cache_key(input_raster, region_code)
+                    zip_object_name = _object_name(
+                        f"{_clip_base_name(new_file_name, region_code)}.zip", prefix
+                    )
+                    if is_uploaded(
+                        upload_cache,
+                        zip_object_name,
+                        cache_key,
+                        COMPANY_bucket_data_hub,
+                    ):
+                        logger.info(
+                            f"Skipping region {region_code} of {input_raster}, already uploaded"
+                        )
+                        finish_task(upload_cache, task)
+                        continue
+
+                    # A grid with the same base name in another subfolder writes the same zip (and JSON) file
+                    # - it must not be rewritten while that clip is zipping or uploading it
+                    zip_file_path = os.path.join(
+                        OUTPUT_FOLDER_ZIPPED,
+                        f"{_clip_base_name(new_file_name, region_code)}.zip",
+                    )
+                    if zip_file_path in zips_in_use:
+                        held_tasks.append((task, zip_file_path))
+                        continue
+
+                    # Get the subfolder name of the input grid, the clipped rasters are kept apart by it
+                    subfolder = os.path.basename(os.path.dirname(input_raster))
+                    output_folder_converted_region = os.path.join(
+                        OUTPUT_FOLDER_REGIONS, subfolder
+                    )
+                    os.makedirs(output_folder_converted_region, exist_ok=True)
+
+                    if input_raster not in source_rasters:
+                        logger.info(f"Processing file: {input_raster}")
+                        source_rasters[input_raster] = _prepare_source_raster(
+                            input_raster, subfolder, new_file_name
+                        )
+
+                    future = executor.submit(
+                        clip_one_region,
+                        source_rasters[input_raster],
+                        regions_by_code[region_code],
+                        new_file_name,
+                        output_folder_converted_region,
+                    )
+                except Exception as e:
+                    arcpy.AddError(
+                        f"Error processing {input_raster} for region {region_code}: {e}"
+                    )
+                    logger.error(
+                        f"Error processing {input_raster} for region {region_code}: {e}"
+                    )
+                    fail_task(upload_cache, task)
+                    continue
+                clip_futures[future] = (
+                    task,
+                    cache_key,
+                    month_and_season,
+                    zip_file_path,
+                )
+
+            if not clip_futures and not region_uploads:
+                # Nothing running and no task left
+                break
+
+            # Log the clips as they finish (the timeout lets the uploads below be checked regularly)
+            done, _ = concurrent.futures.wait(
+                clip_futures, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                task, cache_key, month_and_season, zip_file_path = clip_futures.pop(
+                    future
+                )
+                base_name, input_raster, region_code = task
+                region_code, region_name_ascii, region_wkt, region_extent = (
+                    regions_by_code[region_code]
+                )
+                region_name = lookup_dict_region[region_code]
+                try:
+                    output_clipped_raster, zip_file_path = future.result()
+                except Exception as e:
+                    arcpy.AddError(
+                        f"Error clipping {input_raster} for region {region_name}: {e}"
+                    )
+                    logger.error(
+                        f"Error clipping {input_raster} for region {region_name}: {e}"
+                    )
+                    fail_task(upload_cache, task)
+                    continue
+
+                logger.info(f"Created {zip_file_path} for region {region_name}\n")
+                arcpy.AddMessage(
+                    f"Created {zip_file_path} for region {region_name}\n"
+                    f"Uploading to S3 bucket {COMPANY_bucket_data_hub}/{prefix}..."
+                )
+                # Keep how each upload is started, so a failed upload can be started again from the files on disk
+                start_zip_upload = functools.partial(
+                    upload_file, zip_file_path, COMPANY_bucket_data_hub, prefix
+                )
+                zip_upload = (zip_file_path, start_zip_upload, start_zip_upload())
+
+                """ Create metadata file (JSON format) after the zip file creation as we don't want to include it """
+                md_file, md_payload = create_json_file(
+                    output_clipped_raster,
+                    zip_file_path,
+                    prefix,
+                    region_code,
+                    region_extent,
+                    _region_title(region_name_ascii),
+                    month_and_season,
+                )
+                start_md_upload = functools.partial(
+                    upload_json,
+                    md_payload,
+                    md_file,
+                    COMPANY_bucket_data_hub,
+                    prefix,
+                )
+                md_upload = (md_file, start_md_upload, start_md_upload())
+                region_uploads.append(
+                    (
+                        task,
+                        cache_key,
+                        _object_name(zip_file_path, prefix),
+                        [zip_upload, md_upload],
+                        0,
+                        None,
+                    )
+                )
+
+            # Finish the tasks whose uploads are through
+            region_uploads = settle_uploads(
+                upload_cache, region_uploads, COMPANY_bucket_data_hub
             )
-            os.makedirs(output_folder_converted_region, exist_ok=True)
 
-            # Split the file name at the underscore characters
-            parts = base_name.split("_")
-            last_name = parts[-1].split(".")
-            parameter_code = parts[1]
+    failed_tasks = count_failed_tasks(upload_cache)
+    upload_cache.close()
+    if failed_tasks:
+        arcpy.AddWarning(
+            f"Processing and upload to S3 bucket {COMPANY_bucket_data_hub} finished, but {failed_tasks} region clips failed - "
+            "run the script again to retry them."
+        )
+        logger.warning(
+            f"Processing and upload to S3 bucket {COMPANY_bucket_data_hub} finished, but {failed_tasks} region clips failed - "
+            "run the script again to retry them."
+        )
+        return
 
-            month_and_season = lookup_month_and_season_name[parts[-1]]
+    logger.info(
+        f"Processing and upload to S3 bucket {COMPANY_bucket_data_hub} completed successfully."
+    )
+    arcpy.AddMessage(
+        f"Processing and upload to S3 bucket {COMPANY_bucket_data_hub} (if boto3 is installed) completed successfully."
+    )
 
-            # Compose the new file name by looking up the codes/seasons in the dictionaries and replacing them with their values
-            new_file_name = f"{lookup_dict_parameter[parameter_code]}_{parts[4]}_1991-2020_{month_and_season}"
-            # print(new_file_name)
 
-            output_raster = os.path.join(
-                OUTPUT_FOLDER_CONVERTED, f"{new_file_name}.tif"
+def _warn_duplicate_outputs(ascfile_dict: dict):
+    """Warn about input grids that get the same new file name (e.g. the same base name in two subfolders) - their zips
+    get the same object name in the bucket, so only the one uploaded last is kept"""
+    outputs = collections.defaultdict(list)
+    for base_name, file_list in ascfile_dict.items():
+        try:
+            new_file_name, month_and_season = _build_new_name(base_name)
+        except (ValueError, KeyError):
+            # reported when the task is processed
+            continue
+        outputs[new_file_name].extend(file_list)
+
+    for new_file_name, file_paths in outputs.items():
+        if len(file_paths) > 1:
+            arcpy.AddWarning(
+                f"{len(file_paths)} input grids are uploaded as {new_file_name}_<region>.zip, only one is kept: {', '.join(file_paths)}"
+            )
+            logger.warning(
+                f"{len(file_paths)} input grids are uploaded as {new_file_name}_<region>.zip, only one is kept: {', '.join(file_paths)}"
             )
 
-            # Copy the raster and define the projection
-            arcpy.CopyRaster_management(
-                input_raster, output_raster, config_keyword="CLOUD_OPTIMIZED_GEOTIFF"
+
+def _zips_in_use(clip_futures: dict, region_uploads: list) -> set:
+    """Zip (and JSON) files that a running clip is writing or that are being uploaded"""
+    zips_in_use = {
+        zip_file_path
+        for task, cache_key, month_and_season, zip_file_path in clip_futures.values()
+    }
+    for task, cache_key, zip_object_name, uploads, attempts, retry_at in region_uploads:
+        zips_in_use.update(
+            file_path for file_path, start_upload, upload_future in uploads
+        )
+    return zips_in_use
+
+
+def _prepare_source_raster(
+    input_raster: str, subfolder: str, new_file_name: str
+) -> str:
+    """Return the raster the regions of input_raster are clipped from. Unless the GDAL warp is used or the grid already
+    has its projection defined, the grid is copied to a Cloud Optimized GeoTIFF with the projection defined first
+    """
+    if _use_gdal_warp:
+        # GDAL reprojects and clips each region straight from the ASCII grid, no converted copy needed
+        return input_raster
+
+    if (
+        arcpy.Describe(input_raster).spatialReference.factoryCode
+        == output_projection.factoryCode
+    ):
+        # The grid already has its projection defined (.prj), so the clip can read it directly
+        # - the clip writes its own GeoTIFF, copying the whole grid first would only add a full encode
+        return input_raster
+
+    # One converted raster per subfolder - the workers keep the raster they clip from open,
+    # so it must not be overwritten by the next file with the same base name
+    output_folder_converted = os.path.join(OUTPUT_FOLDER_CONVERTED, subfolder)
+    os.makedirs(output_folder_converted, exist_ok=True)
+    output_raster = os.path.join(output_folder_converted, f"{new_file_name}.tif")
+
+    # Copy the raster and define the projection
+    arcpy.CopyRaster_management(
+        input_raster,
+        output_raster,
+        config_keyword="CLOUD_OPTIMIZED_GEOTIFF",
+    )
+    arcpy.DefineProjection_management(output_raster, output_projection)
+    return output_raster
+
+
+@functools.lru_cache(maxsize=4096)
+def _build_new_name(base_name: str) -> tuple:
+    """Compose the new file name of an input grid and return it with the month/season name.
+    Cached, as it is called for every region of every file with the same base name"""
+    # Pick the parameter code, statistic and period out of the file name
+    name_match = _NAME_RE.match(base_name)
+    if name_match is None:
+        raise ValueError(f"Unexpected file name: {base_name}")
+
+    month_and_season = lookup_month_and_season_name[name_match["period"]]
+
+    # Compose the new file name by looking up the codes/seasons in the dictionaries and replacing them with their values
+    new_file_name = f"{lookup_dict_parameter[name_match['param']]}_{name_match['stat']}_1991-2020_{month_and_season}"
+
+    return new_file_name, month_and_season
+
+
+def load_regions(feature_service_url: str) -> list:
+    """Read the regions (without the Chatham Islands, "99") from the feature service into plain tuples
+    (code, name, WKT geometry, extent) - arcpy Row and Geometry objects can't be pickled and handed to the worker processes.
+    The regions are cached in REGIONS_CACHE by feature service URL, so later runs don't query ArcGIS Online again
+    (delete the cache file when the regions change)"""
+    try:
+        with open(REGIONS_CACHE, "rb") as cache_file:
+            regions_cache = pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        regions_cache = {}
+
+    if feature_service_url in regions_cache:
+        logger.info(f"Using cached regions from {REGIONS_CACHE}")
+        return regions_cache[feature_service_url]
+
+    # Make a feature layer from the ArcGIS Online feature service
+    feature_layer = arcpy.MakeFeatureLayer_management(
+        feature_service_url, "feature_layer"
+    )
+    # Read the geometries as WKT strings rather than arcpy Geometry objects, and only their extent from the cursor
+    # - it also covers true curves, which Esri JSON stores as curveRings rather than rings
+    with arcpy.da.SearchCursor(
+        feature_layer,
+        ["REGC_code", "REGC_name_ascii", "SHAPE@WKT", "SHAPE@EXTENT"],
+        spatial_reference=region_projection,
+    ) as cursor:
+        regions = [
+            (
+                row[0],
+                row[1],
+                row[2],
+                (row[3].XMin, row[3].YMin, row[3].XMax, row[3].YMax),
             )
-            arcpy.DefineProjection_management(output_raster, output_projection)
-
-            # Iterate over the features in the feature layer (to retrieve all regions for clipping individually)
-            with arcpy.da.SearchCursor(
-                feature_layer, ["REGC_code", "REGC_name_ascii", "SHAPE@"]
-            ) as cursor:
-                # Create a Spatial Reference object for the output projection (WGS84)
-                output_sr = arcpy.SpatialReference(4326)
-                for row in cursor:
-                    region_code = row[0]
-                    if region_code == "99":
-                        continue
-                    else:
-                        region_name = lookup_dict_region[region_code]
-                        # region_title is derived from row[1] in the cursor, but we strip "Region" from the string at the end:
-                        region_title = row[1].split(" Region")[0]
-                        if region_title.startswith("Area"):
-                            region_title = "Chatham Islands"
-                        feature_geometry = row[2]
-                        region_extent = feature_geometry.extent
+            for row in cursor
+            if row[0] != "99"
+        ]
 
-                        logger.info(
-                            f"Processing region {region_name} with code {region_code} and title {region_title}"
-                        )
-                        arcpy.AddMessage(
-                            f"Processing region {region_name} with code {region_code} and title {region_title}"
-                        )
+    regions_cache[feature_service_url] = regions
+    with open(REGIONS_CACHE, "wb") as cache_file:
+        pickle.dump(regions_cache, cache_file)
+    logger.info(f"Cached {len(regions)} regions in {REGIONS_CACHE}")
 
-                        output_clipped_raster = os.path.join(
-                            output_folder_converted_region,
-                            f"{new_file_name.split('.')[0]}_{region_name}.tif",
-                        )
+    return regions
 
-                        """ Clip rasters. Use the arcpy.Clip_management tool for clipping region geometries out of the input rasters
-                        - which does not require Spatial Analyst/Licensed Tool """
-                        # run all in a with bracket
-                        with arcpy.EnvManager(
-                            outputCoordinateSystem='PROJCS["NZGD_2000_Transverse_Mercator",GEOGCS["GCS_NZGD_2000",DATUM["D_NZGD_2000",SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],PARAMETER["False_Easting",1600000.0],PARAMETER["False_Northing",10000000.0],PARAMETER["Central_Meridian",173.0],PARAMETER["Scale_Factor",0.9996],PARAMETER["Latitude_Of_Origin",0.0],UNIT["Meter",1.0]]',
-                            cellSize="MINOF",
-                            geographicTransformations="New_Zealand_1949_To_NZGD_2000_3_NTv2",
-                        ):
-                            out_raster = arcpy.Clip_management(
-                                in_raster=output_raster,
-                                out_raster=output_clipped_raster,
-                                in_template_dataset=feature_geometry,
-                                nodata_value="NODATA",
-                                clipping_geometry="ClippingGeometry",
-                                maintain_clipping_extent="NO_MAINTAIN_EXTENT",
-                            )
-                            logger.info(
-                                f"File {output_clipped_raster} with extent {region_extent} for region {region_name} created"
-                            )
-
-                            """ Find all files in the current folder which have the same basename and zip them up """
-                            # get the directory, filename components from output_clipped_raster
-                            base_clip_dir, base_clip_name = os.path.split(
-                                output_clipped_raster
-                            )
-
-                            # Get the base name and extension
-                            tif_base_name, tif_ext = os.path.splitext(base_clip_name)
-
-                            zip_file_path = os.path.join(
-                                OUTPUT_FOLDER_ZIPPED, f"{tif_base_name}.zip"
-                            )
-                            with zipfile.ZipFile(zip_file_path, "w") as zip_file:
-                                # add all files with the same base name to the zip file
-                                for file in os.listdir(base_clip_dir):
-                                    if file.startswith(tif_base_name):
-                                        if file.endswith(".lock"):
-                                            # we don't want any trouble with lockfiles in zip containers
-                                            pass
-                                        else:
-                                            try:
-                                                zip_file.write(
-                                                    os.path.join(base_clip_dir, file),
-                                                    file,
-                                                )
-                                            except Exception as e:
-                                                arcpy.AddError(
-                                                    f"Error adding {file} to {zip_file_path}: {e}"
-                                                )
-                                                logger.error(
-                                                    f"Error adding {file} to {zip_file_path}: {e}"
-                                                )
-
-                            logger.info(
-                                f"Created {zip_file_path} for region {region_name}\n"
-                            )
-                            arcpy.AddMessage(
-                                f"Created {zip_file_path} for region {region_name}\n"
-                                f"Uploading to S3 bucket {COMPANY_bucket_data_hub}/{prefix}..."
-                            )
-
-                            upload_file(zip_file_path, COMPANY_bucket_data_hub, prefix)
-
-                            """ Create metadata file (JSON format) after the zip file creation as we don't want to include it """
-                            md_file = create_json_file(
-                                output_clipped_raster,
-                                prefix,
-                                region_extent,
-                                region_title,
-                                month_and_season,
-                            )
-                            upload_file(md_file, COMPANY_bucket_data_hub, prefix)
 
-    logger.info(
-        f"Processing and upload to S3 bucket {COMPANY_bucket_data_hub} completed successfully."
+def _region_title(region_name_ascii: str) -> str:
+    """region_title is derived from the region name in the layer, but we strip "Region" from the string at the end"""
+    region_title = region_name_ascii.split(" Region")[0]
+    if region_title.startswith("Area"):
+        region_title = "Chatham Islands"
+    return region_title
+
+
+# Scratch workspace and number of GDAL threads of a clip worker process, see _init_clip_worker
+_scratch_dir = None
+_worker_threads = 1
+# Whether the regions are clipped with the GDAL warp or with arcpy, see _gdal_warp_available
+_use_gdal_warp = False
+
+
+def _gdal_warp_available() -> bool:
+    """Check (once per run) that GDAL can do the NZMG -> NZTM transformation of the warp - it needs the NTv2 grid
+    from PROJ-data, which not every GDAL install comes with"""
+    if gdal is None:
+        return False
+    try:
+        source_srs = osr.SpatialReference()
+        source_srs.ImportFromEPSG(27200)
+        source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromEPSG(2193)
+        target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        options = osr.CoordinateTransformationOptions()
+        options.SetOperation(NZMG_TO_NZTM_PIPELINE)
+        transformation = osr.CoordinateTransformation(source_srs, target_srs, options)
+        # PROJ only opens the grid when a point is transformed - a point in Wellington
+        x, y, z = transformation.TransformPoint(2659000, 5990000)
+    except Exception as e:
+        logger.warning(f"GDAL can't do the NZMG to NZTM grid transformation: {e}")
+        return False
+    return math.isfinite(x) and math.isfinite(y)
+
+
+def _worker_cache_max(workers: int):
+    """Share of the GDAL block cache (GDAL_CACHEMAX, see main) for each of the clip workers,
+    or None if it is set in a unit this doesn't handle"""
+    cache_max = os.environ.get("GDAL_CACHEMAX", "")
+    if cache_max.endswith("%"):
+        return f"{float(cache_max[:-1]) / workers:g}%"
+    if cache_max.isdigit():
+        return str(max(1, int(cache_max) // workers))
+    return None
+
+
+def _init_clip_worker(
+    threads: int = 1, use_gdal_warp: bool = False, cache_max: str = None
+):
+    """Set up a clip worker process: its own scratch workspace, so parallel clips don't run into each other's .lock files,
+    the number of threads (instead of all cores) and the block cache size (instead of the whole GDAL_CACHEMAX, see
+    _worker_cache_max) it may use, whether the regions are clipped with the GDAL warp (as chosen by the main process)
+    and the clip environment
+    """
+    global _scratch_dir, _worker_threads, _use_gdal_warp
+    _worker_threads = threads
+    _use_gdal_warp = use_gdal_warp
+    if cache_max is not None:
+        # No raster is open in this process yet, so the block caches of arcpy and GDAL are set up with this size
+        os.environ["GDAL_CACHEMAX"] = cache_max
+    if gdal is not None:
+        gdal.SetConfigOption("GDAL_NUM_THREADS", str(threads))
+        if cache_max is not None:
+            gdal.SetConfigOption("GDAL_CACHEMAX", cache_max)
+    # Clip uses the worker's share of the cores as well
+    arcpy.env.parallelProcessingFactor = str(threads)
+
+    # Kept for the lifetime of the worker - the directory is removed when the worker process exits
+    _scratch_dir = tempfile.TemporaryDirectory(
+        prefix="clip_worker_", ignore_cleanup_errors=True
     )
-    arcpy.AddMessage(
-        f"Processing and upload to S3 bucket {COMPANY_bucket_data_hub} (if boto3 is installed) completed successfully."
+    arcpy.env.scratchWorkspace = _scratch_dir.name
+
+    # The clip environment is the same for every region, so it is set once for the whole worker process
+    arcpy.env.outputCoordinateSystem = 'PROJCS["NZGD_2000_Transverse_Mercator",GEOGCS["GCS_NZGD_2000",DATUM["D_NZGD_2000",SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],PARAMETER["False_Easting",1600000.0],PARAMETER["False_Northing",10000000.0],PARAMETER["Central_Meridian",173.0],PARAMETER["Scale_Factor",0.9996],PARAMETER["Latitude_Of_Origin",0.0],UNIT["Meter",1.0]]'
+    arcpy.env.cellSize = "MINOF"
+    arcpy.env.geographicTransformations = "New_Zealand_1949_To_NZGD_2000_3_NTv2"
+
+
+def _warp_region(source_raster: str, output_clipped_raster: str, region_wkt: str):
+    """Reproject source_raster from NZMG to NZTM and cut it to the region geometry in one GDAL warp,
+    writing a tiled GeoTIFF with world file and statistics like the arcpy clip does. Unlike the arcpy clip,
+    the cells are resampled bilinearly"""
+    # The cutline has to be an OGR datasource, so the region is written to a small in-memory GeoJSON file
+    cutline_path = f"/vsimem/cutline_{os.getpid()}.geojson"
+    cutline = {
+        "type": "FeatureCollection",
+        "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::2193"}},
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": json.loads(
+                    ogr.CreateGeometryFromWkt(region_wkt).ExportToJson()
+                ),
+            }
+        ],
+    }
+    gdal.FileFromMemBuffer(cutline_path, json.dumps(cutline))
+
+    # Keep the cell size of the grid, like cellSize MINOF in the arcpy clip (GDAL would otherwise derive its own)
+    geo_transform = gdal.Open(source_raster).GetGeoTransform()
+    cell_size = min(abs(geo_transform[1]), abs(geo_transform[5]))
+    try:
+        out_dataset = gdal.Warp(
+            output_clipped_raster,
+            source_raster,
+            srcSRS="EPSG:27200",
+            dstSRS="EPSG:2193",
+            cutlineDSName=cutline_path,
+            cropToCutline=True,
+            xRes=cell_size,
+            yRes=cell_size,
+            # same NZGD49 -> NZGD2000 grid transformation as the arcpy clip, not whatever PROJ picks
+            coordinateOperation=NZMG_TO_NZTM_PIPELINE,
+            resampleAlg="bilinear",
+            warpMemoryLimit=512,
+            warpOptions=[f"NUM_THREADS={_worker_threads}"],
+            creationOptions=["COMPRESS=DEFLATE", "TILED=YES", "TFW=YES"],
+        )
+        out_dataset.GetRasterBand(1).ComputeStatistics(False)
+        # Closing the dataset flushes it and writes the statistics to the .aux.xml
+        out_dataset = None
+    finally:
+        gdal.Unlink(cutline_path)
+
+
+@functools.lru_cache(maxsize=1)
+def _resident_raster(raster_path: str, mtime: float) -> arcpy.Raster:
+    """Open raster_path once per worker process, so all regions clipped from it share one decoded raster
+    instead of re-reading it for every clip. mtime is part of the cache key so a rewritten file is opened again
+    """
+    return arcpy.Raster(raster_path)
+
+
+def _clip_base_name(new_file_name: str, region_code: str) -> str:
+    """File name (without extension) of the clip of one region, shared by its GeoTIFF, zip and JSON files"""
+    return f"{new_file_name.split('.')[0]}_{lookup_dict_region[region_code]}"
+
+
+def clip_one_region(
+    source_raster: str,
+    region_row_tuple: tuple,
+    new_file_name: str,
+    output_folder_converted_region: str,
+) -> tuple:
+    """Clip one region out of source_raster and zip the results. Returns the paths of the clipped raster and the zip file.
+    Runs in a worker process, so the region is passed as a plain tuple (code, name, WKT geometry, extent)
+    """
+    region_code, region_name_ascii, region_wkt, region_extent = region_row_tuple
+
+    region_name = lookup_dict_region[region_code]
+
+    logger.info(f"Processing region {region_name} with code {region_code}")
+
+    output_clipped_raster = os.path.join(
+        output_folder_converted_region,
+        f"{_clip_base_name(new_file_name, region_code)}.tif",
     )
 
+    if _use_gdal_warp:
+        # Reproject and clip straight from the ASCII grid in a single warp
+        _warp_region(source_raster, output_clipped_raster, region_wkt)
+    else:
+        """Clip rasters. Use the arcpy.Clip_management tool for clipping region geometries out of the input rasters
+        - which does not require Spatial Analyst/Licensed Tool (unlike arcpy.sa.ExtractByMask)
+        """
+        feature_geometry = arcpy.FromWKT(region_wkt, region_projection)
+        # the output coordinate system etc. are set once per worker in _init_clip_worker
+        out_raster = arcpy.Clip_management(
+            in_raster=_resident_raster(source_raster, os.path.getmtime(source_raster)),
+            out_raster=output_clipped_raster,
+            in_template_dataset=feature_geometry,
+            nodata_value="NODATA",
+            clipping_geometry="ClippingGeometry",
+            maintain_clipping_extent="NO_MAINTAIN_EXTENT",
+        )
+    logger.info(
+        f"File {output_clipped_raster} with extent {region_extent} for region {region_name} created"
+    )
+
+    """ Find all files in the current folder which have the same basename and zip them up """
+    # get the directory, filename components from output_clipped_raster
+    base_clip_dir, base_clip_name = os.path.split(output_clipped_raster)
+
+    # Get the base name and extension
+    tif_base_name, tif_ext = os.path.splitext(base_clip_name)
+
+    # Only look up the files of this raster (.tif, .tfw, .aux.xml, ...) instead of listing the whole region folder,
+    # and leave out lockfiles - we don't want any trouble with lockfiles in zip containers
+    clip_files = [
+        clip_file
+        for clip_file in glob.glob(
+            os.path.join(base_clip_dir, f"{glob.escape(tif_base_name)}.*")
+        )
+        if not clip_file.endswith(".lock")
+    ]
+
+    zip_file_path = os.path.join(OUTPUT_FOLDER_ZIPPED, f"{tif_base_name}.zip")
+    # Compress the zip files, so there is less to upload
+    with zipfile.ZipFile(
+        zip_file_path,
+        "w",
+        compression=zipfile.ZIP_DEFLATED,
+        compresslevel=6,
+        allowZip64=True,
+    ) as zip_file:
+        # add all files with the same base name to the zip file
+        for clip_file in clip_files:
+            file = os.path.basename(clip_file)
+            try:
+                zip_file.write(clip_file, file)
+            except Exception as e:
+                logger.error(f"Error adding {file} to {zip_file_path}: {e}")
+
+    return output_clipped_raster, zip_file_path
+
+
+def _object_name(file_path: str, prefix: str = None) -> str:
+    """Object name of file_path in the S3 bucket"""
+    # Get the file name from the file path
+    file_name = os.path.basename(file_path)
+
+    # Construct the object name with the prefix (if provided)
+    if prefix:
+        return f"{prefix.strip('/')}/{file_name}"
+    return file_name
+
 
 # and upload both the Zip files and the JSON metadata files
 def upload_file(file_path, bucket_name, prefix=None):
@@ -380,21 +943,50 @@ def upload_file(file_path, bucket_name, prefix=None):
     :param file_path: Path to the file to upload
     :param bucket_name: Name of the S3 bucket
     :param prefix: S3 folder name (optional)
-    :return: True if file was uploaded, else False
+    :return: Future of the upload (see wait_for_uploads), or None if the upload could not be started
     """
+    if MANAGER is None:
+        # boto3 isn't available (reported at the start), the file just stays in the output folder
+        return None
 
-    # Get the file name from the file path
-    file_name = os.path.basename(file_path)
+    object_name = _object_name(file_path, prefix)
 
-    # Construct the object name with the prefix (if provided)
-    if prefix:
-        object_name = f"{prefix.strip('/')}/{file_name}"
-    else:
-        object_name = file_name
+    # Start the upload, without waiting for it to finish
+    try:
+        return MANAGER.upload(file_path, bucket_name, object_name)
+    except Exception as e:
+        arcpy.AddWarning(e)
+        arcpy.AddWarning(
+            f"Error uploading {file_path} to S3 bucket {bucket_name}/{prefix}"
+        )
+        logger.error(e)
+        logger.error(f"Error uploading {file_path} to S3 bucket {bucket_name}/{prefix}")
+        return None
+
+
+def upload_json(payload: bytes, file_path: str, bucket_name: str, prefix: str = None):
+    """Upload a metadata JSON straight from memory to an S3 bucket
+
+    :param payload: Content of the JSON file
+    :param file_path: Path of the JSON file (its name is used for the object name)
+    :param bucket_name: Name of the S3 bucket
+    :param prefix: S3 folder name (optional)
+    :return: Future of the upload (see wait_for_uploads), or None if the upload could not be started
+    """
+    if MANAGER is None:
+        # boto3 isn't available (reported at the start)
+        return None
+
+    object_name = _object_name(file_path, prefix)
 
-    # Upload the file
+    # Start the upload, without waiting for it to finish
     try:
-        s3.Bucket(bucket_name).upload_file(file_path, object_name)
+        return MANAGER.upload(
+            io.BytesIO(payload),
+            bucket_name,
+            object_name,
+            extra_args={"ContentType": "application/json"},
+        )
     except Exception as e:
         arcpy.AddWarning(e)
         arcpy.AddWarning(
@@ -402,18 +994,215 @@ def upload_file(file_path, bucket_name, prefix=None):
         )
         logger.error(e)
         logger.error(f"Error uploading {file_path} to S3 bucket {bucket_name}/{prefix}")
+        return None
+
+
+def wait_for_uploads(upload_futures: list, bucket_name: str, prefix: str = None):
+    """Wait for the uploads started by upload_file and report the ones that failed
+
+    :param upload_futures: List of (file_path, future) pairs, future is None for uploads that didn't start
+    :param bucket_name: Name of the S3 bucket
+    :param prefix: S3 folder name (optional)
+    :return: True if all files were uploaded, else False
+    """
+    all_uploaded = True
+    for file_path, upload_future in upload_futures:
+        if upload_future is None:
+            # already reported by upload_file
+            all_uploaded = False
+            continue
+        try:
+            upload_future.result()
+        except Exception as e:
+            arcpy.AddWarning(e)
+            arcpy.AddWarning(
+                f"Error uploading {file_path} to S3 bucket {bucket_name}/{prefix}"
+            )
+            logger.error(e)
+            logger.error(
+                f"Error uploading {file_path} to S3 bucket {bucket_name}/{prefix}"
+            )
+            all_uploaded = False
+    return all_uploaded
+
+
+def open_upload_cache(db_path: str = CACHE_DB) -> sqlite3.Connection:
+    """Open the cache of uploaded clips (created if missing), which maps the object name of an uploaded zip to the
+    cache key of the clip it was uploaded from and its ETag"""
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS uploaded_objects (object_name TEXT PRIMARY KEY, key TEXT NOT NULL, etag TEXT NOT NULL)"
+    )
+    return connection
+
+
+def _upload_cache_key(input_raster: str, region_code: str) -> str:
+    """Cache key of one region of an input grid - changes whenever the grid is modified"""
+    return f"{input_raster}:{os.path.getmtime(input_raster)}:{os.path.getsize(input_raster)}:{region_code}"
+
+
+def is_uploaded(
+    connection: sqlite3.Connection, object_name: str, key: str, bucket_name: str
+) -> bool:
+    """Check if the zip object_name was uploaded from the clip for key before and is still in the bucket, unchanged
+
+    :param connection: Upload cache (see open_upload_cache)
+    :param object_name: Object name of the zip in the S3 bucket
+    :param key: Cache key of the clip
+    :param bucket_name: Name of the S3 bucket
+    :return: True if the zip in the bucket was last uploaded from this clip and still has the ETag recorded in the
+        cache, else False
+    """
+    if MANAGER is None:
+        # without boto3 nothing is uploaded, so nothing is skipped either
+        return False
+    row = connection.execute(
+        "SELECT key, etag FROM uploaded_objects WHERE object_name = ?", (object_name,)
+    ).fetchone()
+    if row is None or row[0] != key:
+        # never uploaded, or last uploaded from another (or an older) input grid
+        return False
+    etag = row[1]
+    try:
+        return (
+            s3_client.head_object(Bucket=bucket_name, Key=object_name)["ETag"] == etag
+        )
+    except Exception:
+        # the object is gone, so it has to be uploaded again
         return False
-    return True
+
+
+def record_upload(
+    connection: sqlite3.Connection, key: str, bucket_name: str, object_name: str
+):
+    """Remember the ETag of an uploaded zip in the upload cache, so the clip is skipped in later runs"""
+    if MANAGER is None:
+        return
+    try:
+        etag = s3_client.head_object(Bucket=bucket_name, Key=object_name)["ETag"]
+    except Exception as e:
+        logger.warning(f"Can't get the ETag of {bucket_name}/{object_name}: {e}")
+        return
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO uploaded_objects (object_name, key, etag) VALUES (?, ?, ?)",
+            (object_name, key, etag),
+        )
+
+
+def _upload_failed(upload_future) -> bool:
+    """Check if an upload started by upload_file/upload_json (and done) failed"""
+    if upload_future is None:
+        # the upload didn't start
+        return True
+    try:
+        upload_future.result()
+    except Exception:
+        return True
+    return False
+
+
+def settle_uploads(
+    connection: sqlite3.Connection,
+    region_uploads: list,
+    bucket_name: str,
+) -> list:
+    """Finish the tasks whose uploads have all completed: record them in the upload cache and mark them done.
+    Uploads that failed are started again after RETRY_DELAY * 2**attempts seconds - only the uploads, the zip and
+    JSON are still there - and the task is marked as failed after MAX_UPLOAD_ATTEMPTS attempts
+
+    :param connection: Upload cache and task queue (see open_upload_cache)
+    :param region_uploads: List of (task, cache key, zip object name, [(file_path, start_upload, future), ...],
+        attempts, retry_at) per region, retry_at is the time the failed uploads are due to start again or None
+    :param bucket_name: Name of the S3 bucket
+    :return: The region uploads that are still running or waiting for a retry
+    """
+    still_running = []
+    for task, cache_key, zip_object_name, uploads, attempts, retry_at in region_uploads:
+        if retry_at is not None:
+            if time.time() < retry_at:
+                still_running.append(
+                    (task, cache_key, zip_object_name, uploads, attempts, retry_at)
+                )
+                continue
+            # Start the failed uploads again, the ones that went through are kept
+            uploads = [
+                (
+                    file_path,
+                    start_upload,
+                    start_upload() if _upload_failed(upload_future) else upload_future,
+                )
+                for file_path, start_upload, upload_future in uploads
+            ]
+            retry_at = None
+
+        if not all(
+            upload_future is None or upload_future.done()
+            for file_path, start_upload, upload_future in uploads
+        ):
+            still_running.append(
+                (task, cache_key, zip_object_name, uploads, attempts, retry_at)
+            )
+        elif MANAGER is None:
+            # boto3 isn't available, the zipped output just stays in the output folder
+            finish_task(connection, task)
+        elif wait_for_uploads(
+            [
+                (file_path, upload_future)
+                for file_path, start_upload, upload_future in uploads
+            ],
+            bucket_name,
+            zip_object_name.rpartition("/")[0],
+        ):
+            record_upload(connection, cache_key, bucket_name, zip_object_name)
+            finish_task(connection, task)
+        elif attempts + 1 >= MAX_UPLOAD_ATTEMPTS:
+            fail_task(connection, task)
+        else:
+            attempts += 1
+            base_name, file_path, region_code = task
+            logger.info(
+                f"Retrying the upload of region {region_code} of {file_path} in {RETRY_DELAY * 2 ** attempts} seconds"
+            )
+            still_running.append(
+                (
+                    task,
+                    cache_key,
+                    zip_object_name,
+                    uploads,
+                    attempts,
+                    time.time() + RETRY_DELAY * 2**attempts,
+                )
+            )
+    return still_running
+
+
+@functools.lru_cache(maxsize=None)
+def _region_geojson_coords(region_code: str, extent: tuple) -> list:
+    """Project the extent (XMin, YMin, XMax, YMax) of a region from NZTM to WGS84 and return its GeoJSON polygon
+    coordinates. Cached by region, so every region is projected only once per run"""
+    xmin, ymin, xmax, ymax = extent
+
+    # Corners of the extent as a closed ring, reprojected in a single call
+    xs = [xmin, xmax, xmax, xmin, xmin]
+    ys = [ymin, ymin, ymax, ymax, ymin]
+    lon, lat = TRANSFORMER_2193_TO_4326.transform(xs, ys)
+
+    return [[[x, y] for x, y in zip(lon, lat)]]
 
 
 def create_json_file(
     file_path: str,
+    zip_file_path: str,
     prefix: str,
-    extent: arcpy.Extent,
+    region_code: str,
+    extent: tuple,
     region_title: str,
     month_and_season: str,
-) -> str:
-    """Use file naming convention and template to extract metadata information into a JSON file"""
+) -> tuple:
+    """Use file naming convention and template to extract metadata information into a JSON file next to the zip file.
+    Returns the path of the JSON file and its content"""
     file_name = os.path.basename(file_path)
     file_stem = os.path.splitext(file_name)[0]
     components = file_name.split("_")
@@ -424,31 +1213,11 @@ def create_json_file(
     statistic = components[1]
     region = components[-1].split(".")[0]
 
-    # # Define the input and output coordinate reference systems
-    # input_crs = "epsg:2193"  # New Zealand Web Mercator
-
-    # Define the input and output coordinate reference systems
-    # input_crs = arcpy.SpatialReference(
-    #     2193
-    # )  # New Zealand Web Mercator (don't need to define this as it's taken from the extent polygon)
-    output_crs = arcpy.SpatialReference(4326)  # WGS 84 (standard for GeoJSON)
-
-    # Reproject the temporary feature class to the output coordinate system
-    reproj_fc = arcpy.Project_management(
-        extent.polygon, r"memory\temp_out_fc", output_crs
-    )[0]
-
-    # Extract the reprojected coordinates
-    coordinates = []
-    with arcpy.da.SearchCursor(reproj_fc, ["SHAPE@"]) as cursor:
-        for row in cursor:
-            coordinates.append([[coord.X, coord.Y] for coord in row[0].getPart(0)])
-
-    # Clean up the temporary feature classes
-    arcpy.Delete_management(reproj_fc)
-
-    # Create the standard GeoJSON polygon, add info that CRS is NZTM (ESPG:2193)
-    geojson = {"type": "Polygon", "coordinates": coordinates}
+    # Create the standard GeoJSON polygon from the (cached) reprojected region extent
+    geojson = {
+        "type": "Polygon",
+        "coordinates": _region_geojson_coords(region_code, extent),
+    }
 
     # We need the ISO-formatted date/time with 'Z' appended
     iso_date_str_startz = iso_date_str_start + "Z"
@@ -489,20 +1258,38 @@ def create_json_file(
         },
     }
 
-    # get the directory, filename components from output_clipped_raster
-    base_json_dir, base_json_file_name = os.path.split(file_path)
-    json_file_name = os.path.splitext(base_json_file_name)[0] + ".json"
-    # Create the JSON file
-    json_file_path = os.path.join(OUTPUT_FOLDER_ZIPPED, json_file_name)
-    with open(json_file_path, "w") as json_file:
-        json.dump(json_data, json_file, indent=4)
-        logger.info(f"Metadata created at {json_file_path}")
-        arcpy.AddMessage(f"Metadata created at {json_file_path}")
+    # Create the JSON file next to the zip file, with the same name
+    json_file_path = os.path.splitext(zip_file_path)[0] + ".json"
+    payload = json.dumps(json_data, indent=4).encode()
+    # The upload is sent from memory, the JSON file is only kept as a record - write it in the background
+    JSON_WRITER.submit(_write_json_file, json_file_path, payload)
+
+    return json_file_path, payload
+
 
-    return json_file_path
+def _write_json_file(json_file_path: str, payload: bytes):
+    """Write the metadata JSON created by create_json_file to disk"""
+    try:
+        with open(json_file_path, "wb") as json_file:
+            json_file.write(payload)
+    except Exception as e:
+        logger.error(f"Error writing {json_file_path}: {e}")
+        return
+    logger.info(f"Metadata created at {json_file_path}")
 
 
 def main():
+    # Tune GDAL (used by arcpy and the warp) before any raster is opened - the clip worker processes inherit these:
+    # a 2 GB block cache, so the regions clipped from one raster don't decompress its tiles again,
+    # and all cores for (de)compression and warping - shared out among the clip workers (see _init_clip_worker).
+    # Values already set in the environment are kept
+    os.environ.setdefault("GDAL_CACHEMAX", "2048")
+    os.environ.setdefault("GDAL_NUM_THREADS", "ALL_CPUS")
+    os.environ.setdefault("GDAL_TIFF_INTERNAL_MASK", "YES")
+    os.environ.setdefault("CHECK_DISK_FREE_SPACE", "NO")
+    # Let CopyRaster (run in this process) use all cores, the clip workers get their share in _init_clip_worker
+    arcpy.env.parallelProcessingFactor = "100%"
+
     # Create the parser
     parser = argparse.ArgumentParser(
         description="A script to export climate ASCII grids/rasters from input folder into region-wise zip files & create metadata file (JSON). Upload to S3 bucket"
@@ -0,0 +1,160 @@
+"""
+Queue of the tasks of a run of copy_esrigrid_to_geotiff_rename_and_clip_w_Arguments.py - one task per input grid and
+region - kept in the SQLite database next to the log (cache.db), so an interrupted run picks up where it stopped.
+
+A task goes pending -> in_progress -> done or failed. Plain sqlite3, no arcpy needed (see test_task_queue.py).
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tasks in progress are marked with the machine that runs them
+WORKER_ID = socket.gethostname()
+
+# A task another machine has had in progress for longer than this (in seconds) is taken as abandoned and queued again
+STALE_TASK_AGE = 6 * 60 * 60
+
+
+def _input_signature(file_path: str) -> str:
+    """Modification time and size of an input grid - changes whenever the grid is modified"""
+    return f"{os.path.getmtime(file_path)}:{os.path.getsize(file_path)}"
+
+
+def enqueue_tasks(connection: sqlite3.Connection, ascfile_dict: dict, regions: list):
+    """Queue one task per input grid and region in the tasks table, in line with the input grids found in this run.
+    If the last run got through all its tasks the queue starts over (the upload cache skips the clips that are
+    unchanged), otherwise the remaining tasks are resumed. Either way, the tasks that failed, the done tasks whose
+    input grid changed since and the tasks left in progress by this machine (or abandoned by another one, see
+    STALE_TASK_AGE) are queued again, and the tasks of input grids that are gone are dropped
+
+    :param connection: Database of the queue (see open_upload_cache)
+    :param ascfile_dict: Input grid paths by base name (see parse_input_files)
+    :param regions: Region tuples, the region code first (see load_regions)
+    """
+    # All tasks of this run, with the signature of the input grid at the time it was queued
+    tasks = []
+    for base_name, file_list in ascfile_dict.items():
+        for file_path in file_list:
+            try:
+                source = _input_signature(file_path)
+            except OSError as e:
+                # removed (or unreadable) since it was listed
+                logger.warning(f"Skipping {file_path}: {e}")
+                continue
+            for region_row_tuple in regions:
+                tasks.append((base_name, file_path, region_row_tuple[0], source))
+
+    with connection:
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(tasks)")}
+        if columns and "source" not in columns:
+            # queue of an earlier version of the script, start over
+            connection.execute("DROP TABLE tasks")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks (base_name TEXT NOT NULL, file_path TEXT NOT NULL, region_code TEXT NOT NULL, "
+            "source TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', worker TEXT, claimed_at REAL, "
+            "PRIMARY KEY (file_path, region_code))"
+        )
+        connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS run_tasks (base_name TEXT NOT NULL, file_path TEXT NOT NULL, "
+            "region_code TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (file_path, region_code))"
+        )
+        connection.execute("DELETE FROM run_tasks")
+        connection.executemany(
+            "INSERT OR IGNORE INTO run_tasks (base_name, file_path, region_code, source) VALUES (?, ?, ?, ?)",
+            tasks,
+        )
+
+        # Drop the tasks of the input grids (or regions) that are gone, they would only fail
+        connection.execute(
+            "DELETE FROM tasks WHERE NOT EXISTS (SELECT 1 FROM run_tasks "
+            "WHERE run_tasks.file_path = tasks.file_path AND run_tasks.region_code = tasks.region_code)"
+        )
+        # Tasks this machine was running when it was interrupted, and tasks another machine abandoned
+        connection.execute(
+            "UPDATE tasks SET status = 'pending' WHERE status = 'in_progress' AND (worker = ? OR claimed_at < ?)",
+            (WORKER_ID, time.time() - STALE_TASK_AGE),
+        )
+
+        # Failed tasks don't keep the run open - they are queued again in any case
+        (open_tasks,) = connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'in_progress')"
+        ).fetchone()
+        if open_tasks:
+            logger.info(f"Resuming {open_tasks} tasks of an interrupted run")
+            connection.execute(
+                "UPDATE tasks SET status = 'pending' WHERE status = 'failed'"
+            )
+        else:
+            connection.execute(
+                "UPDATE tasks SET status = 'pending' WHERE status IN ('done', 'failed')"
+            )
+
+        # Done tasks whose input grid changed since they were queued
+        connection.execute(
+            "UPDATE tasks SET status = 'pending', source = (SELECT source FROM run_tasks "
+            "WHERE run_tasks.file_path = tasks.file_path AND run_tasks.region_code = tasks.region_code) "
+            "WHERE status != 'in_progress' AND source != (SELECT source FROM run_tasks "
+            "WHERE run_tasks.file_path = tasks.file_path AND run_tasks.region_code = tasks.region_code)"
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO tasks (base_name, file_path, region_code, source) "
+            "SELECT base_name, file_path, region_code, source FROM run_tasks"
+        )
+
+
+def claim_task(connection: sqlite3.Connection):
+    """Take the next pending task and mark it in progress for this machine
+
+    :param connection: Task queue (see enqueue_tasks)
+    :return: Tuple (base_name, file_path, region_code), or None if no task is pending
+    """
+    # BEGIN IMMEDIATE takes the write lock up front, so two processes can't claim the same task
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute(
+            "SELECT base_name, file_path, region_code FROM tasks "
+            "WHERE status = 'pending' ORDER BY rowid LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE tasks SET status = 'in_progress', worker = ?, claimed_at = ? WHERE file_path = ? AND region_code = ?",
+                (WORKER_ID, time.time(), row[1], row[2]),
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return row
+
+
+def finish_task(connection: sqlite3.Connection, task: tuple):
+    """Mark a task (see claim_task) as done"""
+    base_name, file_path, region_code = task
+    with connection:
+        connection.execute(
+            "UPDATE tasks SET status = 'done' WHERE file_path = ? AND region_code = ?",
+            (file_path, region_code),
+        )
+
+
+def fail_task(connection: sqlite3.Connection, task: tuple):
+    """Mark a task (see claim_task) as failed, it is retried in the next run"""
+    base_name, file_path, region_code = task
+    with connection:
+        connection.execute(
+            "UPDATE tasks SET status = 'failed' WHERE file_path = ? AND region_code = ?",
+            (file_path, region_code),
+        )
+
+
+def count_failed_tasks(connection: sqlite3.Connection) -> int:
+    """Number of tasks that failed"""
+    (failed_tasks,) = connection.execute(
+        "SELECT COUNT(*) FROM tasks WHERE status = 'failed'"
+    ).fetchone()
+    return failed_tasks
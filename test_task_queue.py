@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import task_queue
+from task_queue import (
+    claim_task,
+    count_failed_tasks,
+    enqueue_tasks,
+    fail_task,
+    finish_task,
+)
+
+REGIONS = [("01", "Northland Region", "POLYGON EMPTY", (0, 0, 1, 1))]
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def grids(tmp_path):
+    """Two input grids, by base name like parse_input_files returns them"""
+    ascfile_dict = {}
+    for base_name in ("good", "bad"):
+        file_path = tmp_path / f"{base_name}.asc"
+        file_path.write_text("ncols 1\n")
+        ascfile_dict[base_name] = [str(file_path)]
+    return ascfile_dict
+
+
+def claim_all(connection):
+    tasks = []
+    while (task := claim_task(connection)) is not None:
+        tasks.append(task)
+    return tasks
+
+
+def statuses(connection):
+    return dict(connection.execute("SELECT base_name, status FROM tasks"))
+
+
+def test_claim_marks_tasks_in_progress(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+
+    tasks = claim_all(connection)
+
+    assert [task[0] for task in tasks] == ["good", "bad"]
+    assert statuses(connection) == {"good": "in_progress", "bad": "in_progress"}
+    assert claim_task(connection) is None
+
+
+def test_interrupted_run_is_resumed(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    finish_task(connection, claim_task(connection))
+
+    # the next run only picks up the task that wasn't done
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["bad"]
+
+
+def test_tasks_left_in_progress_by_this_machine_are_queued_again(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    finish_task(connection, claim_task(connection))
+    claim_task(connection)
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["bad"]
+
+
+def test_complete_run_starts_over(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    for task in claim_all(connection):
+        finish_task(connection, task)
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["good", "bad"]
+
+
+def test_failed_task_does_not_keep_the_run_open(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    good, bad = claim_all(connection)
+    finish_task(connection, good)
+    fail_task(connection, bad)
+    assert count_failed_tasks(connection) == 1
+
+    # run 2 starts over, rather than resuming just the failed task
+    enqueue_tasks(connection, grids, REGIONS)
+    good, bad = claim_all(connection)
+    finish_task(connection, good)
+    fail_task(connection, bad)
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["good", "bad"]
+
+
+def test_failed_task_is_retried_when_resuming(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    fail_task(connection, claim_task(connection))
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert count_failed_tasks(connection) == 0
+    assert [task[0] for task in claim_all(connection)] == ["good", "bad"]
+
+
+def test_changed_grid_is_queued_again_when_resuming(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    finish_task(connection, claim_task(connection))
+    modified = time.time() + 60
+    os.utime(grids["good"][0], (modified, modified))
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["good", "bad"]
+
+
+def test_tasks_of_removed_grids_are_dropped(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    good, bad = claim_all(connection)
+    finish_task(connection, good)
+    fail_task(connection, bad)
+    os.remove(grids["bad"][0])
+
+    # listed, but removed before it was queued
+    enqueue_tasks(connection, grids, REGIONS)
+    assert statuses(connection) == {"good": "pending"}
+
+    # not listed anymore
+    enqueue_tasks(connection, {"good": grids["good"]}, REGIONS)
+    assert statuses(connection) == {"good": "pending"}
+
+
+def test_pending_tasks_of_removed_grids_dont_keep_the_run_open(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    finish_task(connection, claim_task(connection))
+
+    enqueue_tasks(connection, {"good": grids["good"]}, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["good"]
+
+
+def test_task_abandoned_by_another_machine_is_queued_again(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    finish_task(connection, claim_task(connection))
+    with connection:
+        connection.execute(
+            "UPDATE tasks SET status = 'in_progress', worker = 'other', claimed_at = ? WHERE base_name = 'bad'",
+            (time.time() - task_queue.STALE_TASK_AGE - 1,),
+        )
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert [task[0] for task in claim_all(connection)] == ["bad"]
+
+
+def test_task_in_progress_on_another_machine_is_left_to_it(connection, grids):
+    enqueue_tasks(connection, grids, REGIONS)
+    finish_task(connection, claim_task(connection))
+    with connection:
+        connection.execute(
+            "UPDATE tasks SET status = 'in_progress', worker = 'other', claimed_at = ? WHERE base_name = 'bad'",
+            (time.time(),),
+        )
+
+    # the other machine's run is still open, so this one joins it
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert claim_all(connection) == []
+    assert statuses(connection) == {"good": "done", "bad": "in_progress"}
+
+
+def test_queue_of_an_earlier_version_is_replaced(connection, grids):
+    with connection:
+        connection.execute(
+            "CREATE TABLE tasks (base_name TEXT NOT NULL, file_path TEXT NOT NULL, region_code TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', worker TEXT, PRIMARY KEY (file_path, region_code))"
+        )
+        connection.execute(
+            "INSERT INTO tasks (base_name, file_path, region_code, status) VALUES ('good', ?, '01', 'done')",
+            (grids["good"][0],),
+        )
+
+    enqueue_tasks(connection, grids, REGIONS)
+
+    assert statuses(connection) == {"good": "pending", "bad": "pending"}